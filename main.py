@@ -1,25 +1,87 @@
+import os
+import re
 import sys
+import hashlib
+import time
+import argparse
 from pprint import pprint, pformat
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QSplitter, QLabel, QToolBar, QPlainTextEdit, QLineEdit, QListWidget
 from pygdbmi.gdbcontroller import GdbController
 from source.code_viewer import CodeViewer
+from source.latency_proxy import LatencyProxy
+
+PREFETCH_PANELS = ("watch", "backtrace", "threads", "locals")
 
 class MainWindow(QWidget):
-    def __init__(self, program_path):
+    def __init__(self, program_path, non_stop=False, remote=None, attach_pid=None, prefetch=PREFETCH_PANELS,
+                 frame_limit=None, latency_ms=0, sysroot=None, cache_dir=None, read_chunk=None):
         super().__init__()
         self.setWindowTitle("GDB GUI")
         self.resize(1280, 720)
         
         self.program_path = program_path
         self.source_path = ""
+        self.current_thread = None
+        
+        # Non-stop mode: every thread runs and stops on its own, gdb answers
+        # asynchronously and *running/*stopped records are polled from a timer
+        self.non_stop = non_stop
+        self.pending_records = []
+        self.thread_states = {}
+        self.thread_targets = {}
+        self.async_timer = QTimer(self)
+        self.async_timer.setInterval(50)
+        self.async_timer.timeout.connect(self.poll_gdb)
+        
+        # Remote/attach mode: the inferior is already running when we connect,
+        # and every MI command is a network round trip so panel queries are
+        # batched and limited to what --prefetch asks for
+        self.remote = remote
+        self.attach_pid = attach_pid
+        self.prefetch = prefetch
+        self.frame_limit = frame_limit
+        self.latency_ms = latency_ms
+        self.sysroot = sysroot
+        self.read_chunk = read_chunk
+        
+        # The target description and the libraries of a remote target are
+        # kept on disk so later sessions don't pull them over the link again.
+        # The same port can serve another program later, so the binary is part of the key
+        if self.remote:
+            if cache_dir is None:
+                cache_dir = os.path.join(os.path.expanduser("~/.cache/gdbfrontend"), self.remote.replace(":", "_"))
+            cache_dir = os.path.join(cache_dir, self.binary_cache_key())
+        self.tdesc_cache = os.path.join(cache_dir, "tdesc.xml") if cache_dir else None
+        self.library_cache = os.path.join(cache_dir, "sysroot") if cache_dir and not sysroot else None
+        self.using_library_cache = False
+        self.libraries_to_cache = []
+        self.next_token = 1
+        self.exec_started = None
+        self.latency_proxy = None
+        self.abandoned_tokens = set()
+        self.threads_stale = False
+        
+        # A remote command can need many gdbserver round trips (one per
+        # breakpoint on resume, registers of every thread...), so deadlines
+        # grow with --latency
+        latency_sec = latency_ms / 1000
+        self.command_timeout = (10 if remote or attach_pid else 1) + 20 * latency_sec
+        self.connect_timeout = 30 + 60 * latency_sec
+        self.transfer_timeout = 60 + 600 * latency_sec
         
         # self.sources = []
         # self.sources2 = {}
         
         self.gdb = GdbController()
         
-        self.start = self.gdb.write(f"-file-exec-and-symbols {program_path}")
+        self.start = self.gdb_write(f"-file-exec-and-symbols {program_path}")
+        if self.non_stop:
+            # Both settings must be in place before the inferior is started
+            self.start += self.gdb_write("-gdb-set mi-async on")
+            self.start += self.gdb_write("-gdb-set non-stop on")
+        if self.remote or self.attach_pid:
+            self.start += self.setup_target_caches()
         
         # Toolbar section
         toolbar = QToolBar("Toolbar")
@@ -69,6 +131,18 @@ class MainWindow(QWidget):
         until_btn.clicked.connect(self.on_until_click)
         toolbar.addWidget(until_btn)
         
+        self.interrupt_btn = QPushButton("Interrupt")
+        self.interrupt_btn.clicked.connect(self.on_interrupt_click)
+        self.interrupt_btn.setEnabled(self.non_stop)
+        toolbar.addWidget(self.interrupt_btn)
+        
+        # Copying libraries over a slow link takes a while, so it only
+        # happens when asked for
+        self.cache_libs_btn = QPushButton("Cache Libs")
+        self.cache_libs_btn.clicked.connect(self.cache_libraries)
+        self.cache_libs_btn.setEnabled(False)
+        toolbar.addWidget(self.cache_libs_btn)
+        
         reverse_debug_btn = QPushButton("Enable Reverse Debugging")
         reverse_debug_btn.clicked.connect(self.enable_reverse_debugging)
         toolbar.addWidget(reverse_debug_btn)
@@ -174,17 +248,31 @@ class MainWindow(QWidget):
         
         self.print_message_console(self.start)
         self.get_source_files()
+        
+        if self.remote or self.attach_pid:
+            self.connect_target()
 
     # Toolbar button functions
     def run_program(self):
         
-        result = self.gdb.write("-exec-run")
+        if self.remote or self.attach_pid:
+            # Already started by gdbserver or by whoever launched the process
+            self.on_continue()
+            return
+        
+        result = self.gdb_write("-exec-run")
+        
+        if self.non_stop:
+            # The first stop arrives later as a *stopped record
+            self.print_message_console(result)
+            self.async_timer.start()
+            return
         
         frame = self.extract_stopped_frame(result)
         
         self.change_context(frame)
         
-        result2 = self.gdb.write('-interpreter-exec console "set scheduler-locking step"')
+        result2 = self.gdb_write('-interpreter-exec console "set scheduler-locking step"')
         self.print_message_console(result2)
         
         self.post_exec(result)
@@ -195,6 +283,15 @@ class MainWindow(QWidget):
                 return record.get("payload", {}).get("frame", {})
         return {}
     
+    def has_stopped(self, result):
+        return any(record["type"] == "notify" and record["message"] == "stopped" for record in result)
+    
+    def extract_result_payload(self, result):
+        for record in result:
+            if record["type"] == "result" and record["message"] == "done":
+                return record.get("payload") or {}
+        return {}
+    
     def change_context(self, frame):
         try:
             if frame and "line" in frame:
@@ -208,14 +305,357 @@ class MainWindow(QWidget):
 
     def post_exec(self, result):
         self.print_message_console(result)
-        self.print_watched_variables()
-        self.backtrace_refresh()
-        self.threads_refresh()
-        self.get_local_variables()
+        
+        # All panel queries go out in a single batch so gdb can start on the
+        # next one without waiting for us to read each reply
+        commands = []
+        if "watch" in self.prefetch:
+            commands += [self.variable_command(var) for var in self.watched_variables]
+        if "backtrace" in self.prefetch:
+            commands.append(self.backtrace_command())
+        if "threads" in self.prefetch or self.threads_stale:
+            commands.append("-thread-info")
+        else:
+            # Cheap way to keep track of the current thread without listing frames
+            commands.append("-thread-list-ids")
+        if "locals" in self.prefetch:
+            commands.append(self.thread_command("-stack-list-variables --all-values"))
+        results = iter(self.gdb_write_batch(commands))
+        
+        if "watch" in self.prefetch:
+            for var in self.watched_variables:
+                self.print_var(next(results), var)
+        if "backtrace" in self.prefetch:
+            self.backtrace_refresh(next(results))
+        else:
+            self.backtrace_window.clear()
+        if "threads" in self.prefetch or self.threads_stale:
+            self.threads_refresh(next(results))
+        else:
+            current_thread = self.extract_result_payload(next(results)).get("current-thread-id")
+            if current_thread and (not self.non_stop or self.current_thread is None):
+                self.current_thread = current_thread
+        if "locals" in self.prefetch:
+            self.get_local_variables(next(results))
+        else:
+            self.local_variables.clear()
+        
+        if self.exec_started is not None:
+            elapsed_ms = (time.perf_counter() - self.exec_started) * 1000
+            self.debug_output.appendPlainText(f"Stop handled in {elapsed_ms:.0f} ms\n")
+            self.exec_started = None
+        
+    def exec_command(self, command):
+        self.exec_started = time.perf_counter()
+        if self.non_stop:
+            # Only the selected thread moves, its *stopped record is handled in poll_gdb
+            result = self.gdb_write(self.thread_command(command))
+            self.print_message_console(result)
+            return
+        
+        result = self.gdb_write(command)
+        if not self.has_stopped(result) and self.async_timer.isActive():
+            # Still running, poll_gdb refreshes the panels once *stopped arrives
+            self.print_message_console(result)
+            return
+        frame = self.extract_stopped_frame(result)
+        
+        self.change_context(frame)
+        
+        self.post_exec(result)
+        
+    def thread_command(self, command):
+        # In non-stop mode gdb may have switched threads behind our back, so
+        # commands are pinned to the thread selected in the threads panel
+        if not self.non_stop or self.current_thread is None:
+            return command
+        name, _, args = command.partition(" ")
+        return f"{name} --thread {self.current_thread} {args}".strip()
+        
+    def gdb_write(self, command, timeout_sec=None):
+        if timeout_sec is None:
+            timeout_sec = self.command_timeout
+        if self.remote or self.attach_pid:
+            result = self.gdb_write_remote(command, timeout_sec)
+        else:
+            result = self.gdb.write(command, timeout_sec=timeout_sec)
+            self.queue_libraries(result)
+        if self.async_timer.isActive():
+            # Async notifications can show up in the output of any command,
+            # keep them for poll_gdb so callers only see their own result
+            self.pending_records.extend(record for record in result if record["type"] == "notify")
+            result = [record for record in result if record["type"] != "notify"]
+        return result
+    
+    def gdb_write_remote(self, command, timeout_sec):
+        # Read until the command's own result record instead of pygdbmi's
+        # fixed wait, a slow link can take longer and must not raise
+        token = self.next_token
+        self.next_token += 1
+        self.gdb.write(f"{token}{command}", read_response=False)
+        
+        result = []
+        deadline = time.time() + timeout_sec
+        while time.time() < deadline:
+            records = self.gdb_read(timeout_sec=0.1)
+            result += records
+            if any(record.get("token") == token and record["type"] == "result" for record in records):
+                return result
+        
+        self.abandoned_tokens.add(token)
+        result.append(self.timeout_record(token))
+        return result
+    
+    def timeout_record(self, token):
+        return {"type": "result", "message": "error", "payload": {"msg": "timed out"}, "token": token, "stream": "stdout"}
+    
+    def gdb_read(self, timeout_sec):
+        records = self.gdb.get_gdb_response(timeout_sec=timeout_sec, raise_error_on_timeout=False)
+        # Late replies to commands we already gave up on
+        records = [record for record in records if record.get("token") not in self.abandoned_tokens]
+        self.queue_libraries(records)
+        return records
+    
+    def gdb_write_batch(self, commands):
+        # Every command is sent at once, tagged with a token so its result
+        # record can be matched back no matter how gdb interleaves the output
+        if not commands:
+            return []
+        timeout_sec = self.command_timeout * len(commands)
+        tokens = list(range(self.next_token, self.next_token + len(commands)))
+        self.next_token += len(commands)
+        self.gdb.write([f"{token}{command}" for token, command in zip(tokens, commands)], read_response=False)
+        
+        results = {token: [] for token in tokens}
+        untagged = []
+        pending = set(tokens)
+        deadline = time.time() + timeout_sec
+        while pending and time.time() < deadline:
+            for record in self.gdb_read(timeout_sec=0.1):
+                token = record.get("token")
+                if token in results:
+                    results[token].append(record)
+                    if record["type"] == "result":
+                        pending.discard(token)
+                elif self.async_timer.isActive() and record["type"] == "notify":
+                    self.pending_records.append(record)
+                else:
+                    untagged.append(record)
+        
+        for token in pending:
+            self.abandoned_tokens.add(token)
+            results[token].append(self.timeout_record(token))
+        self.print_message_console(untagged)
+        return [results[token] for token in tokens]
+    
+    # Remote target functions
+    def setup_target_caches(self):
+        result = []
+        if self.sysroot:
+            # Shared libraries are read from the local copy instead of the target
+            result += self.gdb_write(f'-gdb-set sysroot {self.sysroot}')
+        elif self.library_cache and os.path.isdir(self.library_cache):
+            # Libraries fetched in earlier sessions, missing ones are added by cache_libraries
+            result += self.gdb_write(f'-gdb-set sysroot {self.library_cache}')
+            self.using_library_cache = True
+        if self.tdesc_cache and os.path.exists(self.tdesc_cache):
+            if self.cached_tdesc_matches():
+                result += self.gdb_write(f'-gdb-set tdesc filename {self.tdesc_cache}')
+            else:
+                # Saved again from the target by save_target_description
+                os.remove(self.tdesc_cache)
+        # Code comes from the local binary instead of the target
+        result += self.gdb_write("-gdb-set trust-readonly-sections on")
+        if self.read_chunk:
+            # Cached memory (stack, code) is fetched in chunks of this size per packet
+            result += self.gdb_write(f"-gdb-set dcache line-size {self.read_chunk}")
+        return result
+    
+    def binary_cache_key(self):
+        digest = hashlib.sha1()
+        with open(self.program_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return f"{os.path.basename(self.program_path)}-{digest.hexdigest()[:12]}"
+    
+    def cached_tdesc_matches(self):
+        with open(self.tdesc_cache) as f:
+            cached = re.search(r"<architecture>(.*?)</architecture>", f.read())
+        result = self.gdb_write('-interpreter-exec console "show architecture"')
+        output = "".join(record["payload"] for record in result if record["type"] == "console")
+        current = re.search(r'currently "([^"]+)"', output)
+        return bool(cached and current and cached.group(1) == current.group(1))
+    
+    def save_target_description(self):
+        if not self.tdesc_cache or os.path.exists(self.tdesc_cache):
+            return
+        result = self.gdb_write('-interpreter-exec console "maint print xml-tdesc"')
+        xml = "".join(record["payload"] for record in result if record["type"] == "console")
+        if result[-1]["message"] == "done" and xml.startswith("<?xml"):
+            os.makedirs(os.path.dirname(self.tdesc_cache), exist_ok=True)
+            with open(self.tdesc_cache, "w") as f:
+                f.write(xml)
+    
+    def queue_libraries(self, records):
+        if not self.library_cache:
+            return
+        for record in records:
+            if record["type"] == "notify" and record["message"] == "library-loaded":
+                library = (record.get("payload") or {}).get("target-name")
+                if library and library not in self.libraries_to_cache and not os.path.exists(self.library_cache_path(library)):
+                    self.libraries_to_cache.append(library)
+                    self.cache_libs_btn.setText(f"Cache Libs ({len(self.libraries_to_cache)})")
+                    self.cache_libs_btn.setEnabled(True)
+    
+    def library_cache_path(self, library):
+        return os.path.join(self.library_cache, library.lstrip("/"))
+    
+    def cache_libraries(self):
+        libraries, self.libraries_to_cache = self.libraries_to_cache, []
+        self.cache_libs_btn.setText("Cache Libs")
+        self.cache_libs_btn.setEnabled(False)
+        fetched = False
+        failed = False
+        for library in libraries:
+            path = self.library_cache_path(library)
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            result = self.gdb_write(f'-interpreter-exec console "remote get {library} {path}"', timeout_sec=self.transfer_timeout)
+            self.print_message_console(result)
+            if not any(record["type"] == "result" and record["message"] == "done" for record in result):
+                if os.path.exists(path):
+                    os.remove(path)
+                failed = True
+                continue
+            fetched = True
+        if fetched and (self.using_library_cache or not failed):
+            # Setting the sysroot again makes gdb reload every shared library,
+            # including those it already failed to find in the cache
+            result = self.gdb_write(f'-gdb-set sysroot {self.library_cache}')
+            self.print_message_console(result)
+            self.using_library_cache = True
+    
+    def connect_target(self):
+        if self.remote:
+            address = self.remote
+            if self.latency_ms:
+                # --latency delays the gdb <-> gdbserver link itself
+                self.latency_proxy = LatencyProxy(self.remote, self.latency_ms)
+                address = self.latency_proxy.address
+            command = f"-target-select remote {address}"
+        else:
+            command = f"-target-attach {self.attach_pid}"
+        result = self.gdb_write(command, timeout_sec=self.connect_timeout)
+        if not any(record["type"] == "result" and record["message"] in ("connected", "done") for record in result):
+            self.print_message_console(result)
+            self.debug_output.appendPlainText("Error: could not connect to the target\n")
+            return
+        self.save_target_description()
+        
+        # Stops that come in after a command has returned are handled by poll_gdb
+        self.async_timer.start()
+        
+        if self.non_stop:
+            self.print_message_console(result)
+            return
+        
+        result2 = self.gdb_write('-interpreter-exec console "set scheduler-locking step"')
+        self.print_message_console(result2)
+        
+        frame = self.extract_stopped_frame(result)
+        if not frame:
+            result3 = self.gdb_write("-stack-info-frame")
+            self.print_message_console(result3)
+            frame = self.extract_result_payload(result3).get("frame", {})
+        self.change_context(frame)
+        
+        self.post_exec(result)
+    
+    # Non-stop mode functions
+    def poll_gdb(self):
+        records = self.pending_records + self.gdb_read(timeout_sec=0)
+        self.pending_records = []
+        if records:
+            self.print_message_console(records)
+            self.handle_async_records(records)
+            
+    def handle_async_records(self, records):
+        for record in records:
+            if record["type"] != "notify":
+                continue
+            payload = record.get("payload") or {}
+            
+            if record["message"] == "running":
+                thread_id = payload.get("thread-id", "all")
+                thread_ids = list(self.thread_states) if thread_id == "all" else [thread_id]
+                for thread_id in thread_ids:
+                    self.thread_states[thread_id] = "running"
+                    self.update_thread_item(thread_id)
+                    
+            elif record["message"] == "stopped":
+                thread_id = payload.get("thread-id")
+                if thread_id is None:
+                    # The inferior exited, nothing is left to show for any thread
+                    self.threads_refresh()
+                    self.backtrace_window.clear()
+                    self.local_variables.clear()
+                    self.code_viewer.current_line = None
+                    self.code_viewer.line_number_area.update()
+                    continue
+                
+                stopped_threads = payload.get("stopped-threads", [thread_id])
+                if stopped_threads == "all":
+                    stopped_threads = list(self.thread_states)
+                for stopped_thread in stopped_threads:
+                    self.thread_states[stopped_thread] = "stopped"
+                    self.update_thread_item(stopped_thread, payload.get("frame") if stopped_thread == thread_id else None)
+                
+                # Panels show the thread that stopped unless the selected thread
+                # is itself stopped, in which case the new stop only updates its row.
+                # In all-stop mode gdb always switches to the thread that stopped
+                if not self.non_stop or self.current_thread is None or self.thread_states.get(self.current_thread) != "stopped":
+                    self.current_thread = thread_id
+                    self.select_thread_item(thread_id)
+                    
+                if thread_id == self.current_thread:
+                    self.change_context(payload.get("frame", {}))
+                    self.post_exec([])
+                    
+            elif record["message"] in ("thread-created", "thread-exited"):
+                if self.non_stop and "threads" in self.prefetch:
+                    self.threads_refresh()
+                else:
+                    # An all-stop gdb doesn't answer while the target runs,
+                    # the threads panel catches up on the next stop
+                    self.threads_stale = True
+                
+    def thread_item_text(self, thread_id, frame):
+        target = self.thread_targets.get(thread_id, "")
+        if self.thread_states.get(thread_id) == "running":
+            return f"#{thread_id} {target} (running)"
+        frame_file = frame.get("file", "?")
+        frame_line = frame.get("line", "?")
+        return f"#{thread_id} {target} () at {frame_file}:{frame_line}"
+    
+    def select_thread_item(self, thread_id):
+        for row in range(self.threads_window.count()):
+            if self.threads_window.item(row).text().split(" ")[0][1:] == thread_id:
+                self.threads_window.setCurrentRow(row)
+                return
+    
+    def update_thread_item(self, thread_id, frame=None):
+        for row in range(self.threads_window.count()):
+            item = self.threads_window.item(row)
+            if item.text().split(" ")[0][1:] == thread_id:
+                # A stopped row without a new frame keeps its previous location
+                if frame or self.thread_states.get(thread_id) == "running" or item.text().endswith("(running)"):
+                    item.setText(self.thread_item_text(thread_id, frame or {}))
+                return
         
     def enable_reverse_debugging(self):
         if self.reverse_debug_enabled == False:
-            result3 = self.gdb.write('-interpreter-exec console "target record-full"')
+            result3 = self.gdb_write('-interpreter-exec console "target record-full"')
             
             self.reverse_debug_enabled = True
             self.prev_btn.setEnabled(True)
@@ -228,80 +668,46 @@ class MainWindow(QWidget):
             print("Reverse debugging is already enabled")
 
     def next_line(self):
-        result = self.gdb.write("-exec-next")
-        # message = result[-1]
-        # pprint(result)
-        frame = self.extract_stopped_frame(result)
-        # print(frame)
-        
-        self.change_context(frame)
-            
-        self.post_exec(result)
+        self.exec_command("-exec-next")
         
     def prev_line(self):
-        result = self.gdb.write("-exec-next --reverse")
-        frame = self.extract_stopped_frame(result)
+        self.exec_command("-exec-next --reverse")
         
-        self.change_context(frame)
-            
-        self.post_exec(result)
-
     def step_in(self):
-        result = self.gdb.write("-exec-step")
-        frame = self.extract_stopped_frame(result)
-        
-        self.change_context(frame)
-            
-        self.post_exec(result)
+        self.exec_command("-exec-step")
         
     def step_out(self):
-        result = self.gdb.write("-exec-step --reverse")
-        frame = self.extract_stopped_frame(result)
+        self.exec_command("-exec-step --reverse")
         
-        self.change_context(frame)
-            
-        self.post_exec(result)
-
     def on_continue(self):
-        result = self.gdb.write("-exec-continue")
-        frame = self.extract_stopped_frame(result)
-        
-        self.change_context(frame)
-            
-        self.post_exec(result)
+        self.exec_command("-exec-continue")
         
     def continue_reverse(self):
-        result = self.gdb.write("-exec-continue --reverse")
-        frame = self.extract_stopped_frame(result)
-        
-        self.change_context(frame)
-            
-        self.post_exec(result)
+        self.exec_command("-exec-continue --reverse")
         
     def on_finish_click(self):
-        result = self.gdb.write("-exec-finish")
-        frame = self.extract_stopped_frame(result)
-        
-        self.change_context(frame)
-
-        self.post_exec(result)
+        self.exec_command("-exec-finish")
         
     def finish_reverse(self):
-        result = self.gdb.write("-exec-finish --reverse")
-        frame = self.extract_stopped_frame(result)
-        
-        self.change_context(frame)
-
-        self.post_exec(result)
+        self.exec_command("-exec-finish --reverse")
         
     def on_until_click(self):
-        result = self.gdb.write("-exec-until")
-        self.post_exec(result)
+        self.exec_command("-exec-until")
+        
+    def on_interrupt_click(self):
+        result = self.gdb_write(self.thread_command("-exec-interrupt"))
+        self.print_message_console(result)
         
     # Backtrace window functions
-    def backtrace_refresh(self):
+    def backtrace_command(self):
+        if self.frame_limit:
+            return self.thread_command(f"-stack-list-frames 0 {self.frame_limit - 1}")
+        return self.thread_command("-stack-list-frames")
+    
+    def backtrace_refresh(self, result=None):
         self.backtrace_window.clear()
-        result = self.gdb.write("-stack-list-frames")
+        if result is None:
+            result = self.gdb_write(self.backtrace_command())
         # print(result)
         
         if result[0]["message"] == 'error':
@@ -316,9 +722,9 @@ class MainWindow(QWidget):
         
     def backtrace_window_on_item_click(self, item):
         frame_id = item.text().split(" ")[0][1:]
-        result = self.gdb.write(f"-stack-select-frame {frame_id}")
+        result = self.gdb_write(self.thread_command(f"-stack-select-frame {frame_id}"))
         # print(result)
-        result2 = self.gdb.write("-stack-info-frame")
+        result2 = self.gdb_write(self.thread_command("-stack-info-frame"))
         # print(result2)
         try:
             self.code_viewer.file_path = result2[0]["payload"]["frame"]["fullname"]
@@ -330,31 +736,41 @@ class MainWindow(QWidget):
         self.print_message_console(result)
         self.print_message_console(result2)
     
-    def threads_refresh(self):
+    def threads_refresh(self, result=None):
         self.threads_window.clear()
-        result = self.gdb.write("-thread-info")
+        self.threads_stale = False
+        if result is None:
+            result = self.gdb_write("-thread-info")
         # pprint(result)
         try:
-            self.current_thread = result[0]["payload"]["current-thread-id"]
+            # In non-stop mode the selection belongs to the user, not to gdb
+            if not self.non_stop or self.current_thread is None:
+                self.current_thread = result[0]["payload"].get("current-thread-id")
+            self.thread_states = {}
             for thread in result[0]["payload"]["threads"]:
                 thread_id = thread["id"]
                 thread_target_id = thread["target-id"]
                 thread_target_id_split = thread_target_id.split("(")[0].strip()
                 thread_name = thread.get("name", "")
                 thread_frame = thread.get("frame", {})
-                thread_frame_file = thread_frame.get("file", "?")
-                thread_frame_line = thread_frame.get("line", "?")
-                self.threads_window.addItem(f"#{thread_id} {thread_target_id_split} () at {thread_frame_file}:{thread_frame_line}")
+                self.thread_targets[thread_id] = thread_target_id_split
+                self.thread_states[thread_id] = thread.get("state", "stopped")
+                self.threads_window.addItem(self.thread_item_text(thread_id, thread_frame))
+            self.select_thread_item(self.current_thread)
         except Exception as e:
             print(f"Error: {e}")
     
     def threads_window_on_item_click(self, item):
         thread_id = item.text().split(" ")[0][1:]
-        result = self.gdb.write(f"-thread-select {thread_id}")
+        result = self.gdb_write(f"-thread-select {thread_id}")
         
         pprint(result)
         
         self.current_thread = thread_id
+        if self.thread_states.get(thread_id) == "running":
+            # A running thread has no frame to show until it stops
+            self.print_message_console(result)
+            return
         try:
             self.code_viewer.file_path = result[0]["payload"]["frame"]["fullname"]
             self.code_viewer.set_current_line(result[0]["payload"]["frame"]["line"])
@@ -366,11 +782,11 @@ class MainWindow(QWidget):
     def on_breakpoint_toggle(self, line, is_set, file):
         if is_set:
             # print(f"Breakpoint toggled off in line {line}")
-            result = self.gdb.write(f'-interpreter-exec console "clear {file}:{line}"')
+            result = self.gdb_write(f'-interpreter-exec console "clear {file}:{line}"')
             self.print_message_console(result)
         else:
             # print(f"Breakpoint toggled on in line {line}")
-            result = self.gdb.write(f"-break-insert --source {self.code_viewer.file_path} --line {line}")
+            result = self.gdb_write(f"-break-insert --source {self.code_viewer.file_path} --line {line}")
             for message in result:
                 bkpt = message.get("payload", {}).get("bkpt")
                 if bkpt and "line" in bkpt:
@@ -379,8 +795,11 @@ class MainWindow(QWidget):
                     # self.code_viewer.set_current_line(bkpt["line"])
             self.print_message_console(result)
             
+    def variable_command(self, var):
+        return self.thread_command(f'-data-evaluate-expression "{var}"')
+    
     def get_variable_value(self, var):
-        result = self.gdb.write(f'-data-evaluate-expression "{var}"')
+        result = self.gdb_write(self.variable_command(var))
         self.print_var(result, var)
         
     def print_var(self, result, var):
@@ -393,9 +812,6 @@ class MainWindow(QWidget):
     def add_var_to_watchlist(self, var):
         self.watched_variables.append(var)
         
-    def print_watched_variables(self):
-        for var in self.watched_variables:
-            self.get_variable_value(var)
 
     # Command line function
     def send_command(self):
@@ -404,19 +820,19 @@ class MainWindow(QWidget):
         # print(result)
         self.debug_output.appendPlainText(command)
         if command.startswith("-"):
-            result = self.gdb.write(command)
+            result = self.gdb_write(command)
         else:
-            result = self.gdb.write(f'-interpreter-exec console "{command}"')
+            result = self.gdb_write(f'-interpreter-exec console "{command}"')
         self.print_message_console(result)
     
     def get_source_file(self):
-        result = self.gdb.write("-file-list-exec-source-file")
+        result = self.gdb_write("-file-list-exec-source-file")
         # print(result)
         self.source_path = result[0]["payload"]["fullname"]
         
     # Source files explorer functions
     def get_source_files(self):
-        result = self.gdb.write("-file-list-exec-source-files")
+        result = self.gdb_write("-file-list-exec-source-files")
         # print(result)
         
         self.code_viewer.file_path = result[0]["payload"]["files"][0]["fullname"]
@@ -441,8 +857,9 @@ class MainWindow(QWidget):
         #     if self.sources2[key] == item.text():
         #         file_path = key
         
-    def get_local_variables(self):
-        result = self.gdb.write("-stack-list-variables --all-values")
+    def get_local_variables(self, result=None):
+        if result is None:
+            result = self.gdb_write(self.thread_command("-stack-list-variables --all-values"))
         self.local_variables.clear()
         # print(result)
         if result[0]["message"] == "error":
@@ -455,7 +872,7 @@ class MainWindow(QWidget):
                 self.local_variables.addItem(f"{name} = {value}")
             
     def get_frame_variables(self, frame):
-        result = self.gdb.write(f"-stack-list-variables --thread {self.current_thread} --frame {frame} --all-values")
+        result = self.gdb_write(f"-stack-list-variables --thread {self.current_thread} --frame {frame} --all-values")
         self.local_variables.clear()
         # print(result)
         for var in result[0]["payload"]["variables"]:
@@ -475,11 +892,43 @@ class MainWindow(QWidget):
                 self.debug_output.appendPlainText(line)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python main.py <binary>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="GDB GUI")
+    parser.add_argument("binary")
+    parser.add_argument("--non-stop", action="store_true", help="stop, step and continue each thread on its own")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--remote", metavar="HOST:PORT", help="connect to a running gdbserver")
+    target.add_argument("--attach", metavar="PID", type=int, help="attach to a running process")
+    parser.add_argument("--prefetch", default=",".join(PREFETCH_PANELS),
+                        help=f"panels refreshed on every stop, comma separated (default: {','.join(PREFETCH_PANELS)})")
+    parser.add_argument("--frame-limit", type=int, help="maximum number of frames shown in the backtrace")
+    parser.add_argument("--latency", type=int, default=0, metavar="MS", help="add MS milliseconds to every round trip to gdbserver (with --remote)")
+    parser.add_argument("--sysroot", help="local copy of the target libraries, skips the library cache")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="where the target description and libraries of --remote are cached (default: ~/.cache/gdbfrontend/HOST_PORT)")
+    parser.add_argument("--read-chunk", type=int, default=4096, metavar="BYTES",
+                        help="bytes read per memory packet with --remote/--attach, a power of two (default: 4096)")
+    args = parser.parse_args()
+
+    prefetch = tuple(panel for panel in args.prefetch.split(",") if panel)
+    for panel in prefetch:
+        if panel not in PREFETCH_PANELS:
+            parser.error(f"unknown panel '{panel}' in --prefetch, choose from {','.join(PREFETCH_PANELS)}")
+    if args.frame_limit is not None and args.frame_limit < 1:
+        parser.error("--frame-limit must be at least 1")
+    if args.latency < 0:
+        parser.error("--latency can't be negative")
+    if args.latency and not args.remote:
+        parser.error("--latency only applies to --remote")
+    if args.cache_dir and not args.remote:
+        parser.error("--cache-dir only applies to --remote")
+    if args.sysroot and not (args.remote or args.attach):
+        parser.error("--sysroot only applies to --remote or --attach")
+    if args.read_chunk < 2 or args.read_chunk & (args.read_chunk - 1):
+        parser.error("--read-chunk must be a power of two")
 
     app = QApplication(sys.argv)
-    win = MainWindow(sys.argv[1])
+    win = MainWindow(args.binary, non_stop=args.non_stop, remote=args.remote, attach_pid=args.attach, prefetch=prefetch,
+                     frame_limit=args.frame_limit, latency_ms=args.latency, sysroot=args.sysroot,
+                     cache_dir=args.cache_dir, read_chunk=args.read_chunk)
     win.show()
     sys.exit(app.exec_())
\ No newline at end of file
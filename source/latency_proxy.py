@@ -0,0 +1,71 @@
+import socket
+import threading
+import time
+from queue import Queue
+
+class LatencyProxy:
+    # TCP forwarder placed between gdb and gdbserver, every chunk is held for
+    # half the requested round trip time in each direction
+    def __init__(self, target, latency_ms):
+        host, port = target.rsplit(":", 1)
+        self.target = (host or "localhost", int(port))
+        self.delay = latency_ms / 2000
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.address = f"127.0.0.1:{self.server.getsockname()[1]}"
+
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            try:
+                upstream = socket.create_connection(self.target)
+            except OSError as e:
+                print(f"Error: {e}")
+                client.close()
+                continue
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.start_pipe(client, upstream)
+            self.start_pipe(upstream, client)
+
+    def start_pipe(self, src, dst):
+        # Reading and writing run separately so delayed chunks keep flowing
+        # back to back instead of each one waiting for the previous delay
+        queue = Queue()
+        threading.Thread(target=self.read_loop, args=(src, queue), daemon=True).start()
+        threading.Thread(target=self.write_loop, args=(dst, queue), daemon=True).start()
+
+    def read_loop(self, src, queue):
+        while True:
+            try:
+                data = src.recv(65536)
+            except OSError:
+                data = b""
+            queue.put((time.monotonic() + self.delay, data))
+            if not data:
+                return
+
+    def write_loop(self, dst, queue):
+        while True:
+            deadline, data = queue.get()
+            wait = deadline - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                if not data:
+                    dst.shutdown(socket.SHUT_WR)
+                    return
+                dst.sendall(data)
+            except OSError:
+                return
+
+    def close(self):
+        self.server.close()